@@ -18,7 +18,7 @@
 # We encourage users to inform us about their use of this plugin for research purposes.
 # Contact: holmes@ruc.dk
 
-from qgis.PyQt.QtCore import QCoreApplication
+from qgis.PyQt.QtCore import QCoreApplication, QElapsedTimer
 from qgis.core import (
     QgsProcessing,
     QgsProcessingAlgorithm,
@@ -26,23 +26,165 @@ from qgis.core import (
     QgsProcessingParameterFolderDestination,
     QgsProcessingParameterString,
     QgsProcessingParameterBoolean,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterDefinition,
     QgsProcessingException,
     QgsVectorLayer,
     QgsMapLayer,
+    QgsFeatureRequest,
 )
 from qgis.utils import iface
-from ftplib import FTP_TLS
+from ftplib import FTP_TLS, error_perm, error_reply, error_temp
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+import calendar
+import io
+import queue
+import select
+import threading
+import time
 import ssl
 import os
+import shutil
+import socket
+import sys
+import tempfile
 import zipfile
 
+try:
+    # Optional: python-isal decodes DEFLATE with Intel's ISA-L SIMD routines,
+    # several times faster than the standard zlib module.
+    from isal import isal_zlib
+except ImportError:
+    isal_zlib = None
+
+try:
+    # Optional: the 'deflate' package wraps libdeflate, whose CRC32 uses
+    # carry-less multiplication (PCLMULQDQ) instead of zlib's lookup tables.
+    import deflate
+except ImportError:
+    deflate = None
+
+# Transfer tuning: read the data channel in large blocks and buffer writes to
+# disk so a large tile does not cost one syscall per 8 KiB.
+TRANSFER_BLOCKSIZE = 1 << 20
+WRITE_BUFFER_SIZE = 4 << 20
+RECEIVE_BUFFER_SIZE = 4 << 20
+
+# One TLS context shared by all connections instead of one per connection.
+# Like ftplib's default context it does not verify the server certificate;
+# it only refuses protocol versions older than TLS 1.2.
+_SHARED_SSL_CONTEXT = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+_SHARED_SSL_CONTEXT.check_hostname = False
+_SHARED_SSL_CONTEXT.verify_mode = ssl.CERT_NONE
+_SHARED_SSL_CONTEXT.minimum_version = ssl.TLSVersion.TLSv1_2
+
+# Files smaller than this are always fetched over a single stream
+PARALLEL_MIN_SIZE = 64 << 20
+
+# Size of the unzip pool shared by all downloads
+UNZIP_WORKERS = os.cpu_count() or 1
+
+# Written next to the extracted files when a zip is unpacked without being
+# kept, so a later run can tell that the archive was already fetched.
+UNPACKED_MARKER_SUFFIX = '.unpacked'
+
+
+def _use_isal_for_unzip():
+    """
+    Make zipfile decompress DEFLATE members with isal when it is installed.
+
+    Only the decompressor is replaced, so zip files written elsewhere in QGIS
+    keep using zlib and its compression levels. Safe to call more than once.
+    """
+    if isal_zlib is None or getattr(zipfile._get_decompressor, 'uses_isal', False):
+        return
+    stdlib_get_decompressor = zipfile._get_decompressor
+
+    def get_decompressor(compress_type):
+        if compress_type == zipfile.ZIP_DEFLATED:
+            return isal_zlib.decompressobj(-15)
+        return stdlib_get_decompressor(compress_type)
+
+    get_decompressor.uses_isal = True
+    zipfile._get_decompressor = get_decompressor
+
+
+def _use_fast_crc32_for_unzip():
+    """
+    Make zipfile verify member checksums with a SIMD CRC32 when one is installed.
+
+    libdeflate is preferred, isal's CRC32 is used otherwise; both give the same
+    values as zlib.crc32, so this is safe for zip writing as well.
+    """
+    if deflate is not None:
+        zipfile.crc32 = deflate.crc32
+    elif isal_zlib is not None:
+        zipfile.crc32 = isal_zlib.crc32
+
+
+def _drop_from_page_cache(path):
+    """Ask the kernel to evict a finished download from the page cache, where posix_fadvise exists."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        # No sync first, so the worker never waits for the disk: pages the
+        # kernel has not written back yet stay cached until it does.
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass  # Only a hint, the download itself succeeded
+    finally:
+        os.close(fd)
+
+
+def _data_receive_buffer_size():
+    """Return the SO_RCVBUF for data connections, or None to leave Linux autotuning on."""
+    if not sys.platform.startswith('linux'):
+        return RECEIVE_BUFFER_SIZE
+    try:
+        with open('/proc/sys/net/core/rmem_max') as f:
+            rmem_max = int(f.read())
+        with open('/proc/sys/net/ipv4/tcp_rmem') as f:
+            autotune_max = int(f.read().split()[2])
+    except (OSError, ValueError, IndexError):
+        return None
+    if 2 * min(RECEIVE_BUFFER_SIZE, rmem_max) > autotune_max:
+        return RECEIVE_BUFFER_SIZE
+    return None
+
+
+_use_isal_for_unzip()
+_use_fast_crc32_for_unzip()
+DATA_RECEIVE_BUFFER_SIZE = _data_receive_buffer_size()
+
+class SeekableSpooledTemporaryFile(tempfile.SpooledTemporaryFile):
+    """
+    SpooledTemporaryFile that ZipFile can read from on Python < 3.11, where
+    SpooledTemporaryFile lacks the seekable() method ZipFile relies on.
+    """
+    def seekable(self):
+        """Both the in-memory buffer and the rolled-over file are seekable."""
+        return True
+
+class DownloadCanceled(Exception):
+    """Raised inside a transfer when the user cancels the algorithm."""
+
+class ExtraConnectionError(Exception):
+    """Raised when the pool cannot log in an extra connection, e.g. at the server's per-user limit."""
+
 class ImplicitFTP_TLS(FTP_TLS):
     """
     FTP_TLS subclass that automatically wraps sockets in SSL to support implicit FTPS.
     """
     def __init__(self, *args, **kwargs):
+        kwargs.setdefault('context', _SHARED_SSL_CONTEXT)
         super().__init__(*args, **kwargs)
         self._sock = None
+        self._binary_mode = False
 
     @property
     def sock(self):
@@ -56,6 +198,269 @@ class ImplicitFTP_TLS(FTP_TLS):
             value = self.context.wrap_socket(value)
         self._sock = value
 
+    def voidcmd(self, cmd):
+        """
+        Send a command, but skip 'TYPE I' once the session is in binary mode.
+
+        retrbinary() and retrfile() send 'TYPE I' before every transfer; on a pooled
+        connection that only costs a round trip per file.
+        """
+        if cmd == 'TYPE I':
+            if self._binary_mode:
+                return '200 Switching to Binary mode.'
+            resp = super().voidcmd(cmd)
+            self._binary_mode = True
+            return resp
+        if cmd.startswith('TYPE'):
+            self._binary_mode = False
+        return super().voidcmd(cmd)
+
+    def sendcmd(self, cmd):
+        """Send a command, tracking transfer type changes made through sendcmd (e.g. by retrlines)."""
+        if cmd.startswith('TYPE'):
+            self._binary_mode = False
+        return super().sendcmd(cmd)
+
+    def ntransfercmd(self, cmd, rest=None):
+        """Open the data connection with an enlarged receive buffer where that helps."""
+        conn, size = super().ntransfercmd(cmd, rest)
+        if DATA_RECEIVE_BUFFER_SIZE is not None:
+            try:
+                conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, DATA_RECEIVE_BUFFER_SIZE)
+            except OSError:
+                pass  # Not critical, keep the OS default
+        return conn, size
+
+    def retrfile(self, cmd, fileobj, blocksize=TRANSFER_BLOCKSIZE, is_canceled=None):
+        """
+        Retrieve a file in binary mode straight into a file object, without a per-block callback.
+        A cancel closes the data connection rather than sending ABOR, which a server blocked on a
+        full data socket would not read; the session is then out of step and must be discarded.
+        """
+        self.voidcmd('TYPE I')
+        with self.transfercmd(cmd) as conn:
+            # A clear data channel can be moved into a real file by the kernel
+            if (hasattr(os, 'splice') and not isinstance(conn, ssl.SSLSocket)
+                    and isinstance(fileobj, io.BufferedWriter)):
+                self._splice_to_file(conn, fileobj, blocksize, is_canceled)
+                return self.voidresp()
+            with conn.makefile('rb', buffering=blocksize) as reader:
+                if is_canceled is None:
+                    shutil.copyfileobj(reader, fileobj, length=blocksize)
+                else:
+                    while True:
+                        data = reader.read(blocksize)
+                        if not data:
+                            break
+                        if is_canceled():
+                            raise DownloadCanceled()
+                        fileobj.write(data)
+            # shutdown SSL layer
+            if isinstance(conn, ssl.SSLSocket):
+                conn.unwrap()
+        return self.voidresp()
+
+    def _splice_to_file(self, conn, fileobj, blocksize, is_canceled):
+        """
+        Copy an unencrypted data connection into a file with splice(2) through
+        a pipe, so the data never passes through user space. Linux only.
+        """
+        fileobj.flush()
+        out_fd = fileobj.fileno()
+        read_end, write_end = os.pipe()
+        try:
+            while True:
+                try:
+                    received = os.splice(conn.fileno(), write_end, blocksize)
+                except BlockingIOError:
+                    # Sockets with a timeout are non-blocking underneath
+                    if not select.select([conn], [], [], conn.gettimeout())[0]:
+                        raise socket.timeout("timed out")
+                    continue
+                if not received:
+                    break
+                while received:
+                    received -= os.splice(read_end, out_fd, received)
+                if is_canceled is not None and is_canceled():
+                    raise DownloadCanceled()
+        finally:
+            os.close(read_end)
+            os.close(write_end)
+
+
+class FtpsPool:
+    """
+    Thread-safe pool of logged-in FTPS connections.
+
+    Connections are created lazily by ``factory`` up to ``max_size`` and handed
+    out to one thread at a time. A background thread sends NOOP on connections
+    that have been idle for ``keepalive`` seconds so the server does not drop them.
+    On top of those, at most ``max_extra`` short-lived connections can be open
+    at once through extra_connection().
+    """
+    def __init__(self, factory, max_size, keepalive=30, max_extra=0):
+        self._factory = factory
+        self._max_size = max_size
+        self._keepalive = keepalive
+        self._extra = threading.BoundedSemaphore(max(max_extra, 1))
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._keepalive_thread = threading.Thread(target=self._keep_alive, daemon=True)
+        self._keepalive_thread.start()
+
+    def acquire(self, is_canceled=lambda: False):
+        """Return an idle connection, creating one if the pool is not yet full."""
+        while True:
+            try:
+                return self._idle.get_nowait()[0]
+            except queue.Empty:
+                pass
+            with self._lock:
+                if self._created < self._max_size:
+                    self._created += 1
+                    break
+            # Pool is full; wait for a release, but re-check capacity now and
+            # then in case a broken connection was discarded meanwhile.
+            try:
+                return self._idle.get(timeout=1)[0]
+            except queue.Empty:
+                if is_canceled():
+                    raise DownloadCanceled()
+
+        try:
+            return self._factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def release(self, ftps):
+        """Return a healthy connection to the pool."""
+        if self._closed.is_set():
+            self._close(ftps)
+        else:
+            self._idle.put((ftps, time.monotonic()))
+
+    def discard(self, ftps):
+        """Close a broken connection and free its slot in the pool."""
+        self._close(ftps)
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def connection(self, is_canceled=lambda: False):
+        """
+        Context manager around acquire()/release(). The connection is discarded
+        instead of returned if the block fails with anything but a permanent
+        FTP error (e.g. 550 file not found), which leaves the session usable.
+        """
+        ftps = self.acquire(is_canceled)
+        try:
+            yield ftps
+        except error_perm:
+            self.release(ftps)
+            raise
+        except BaseException:
+            self.discard(ftps)
+            raise
+        else:
+            self.release(ftps)
+
+    @contextmanager
+    def extra_connection(self, is_canceled=lambda: False):
+        """
+        Context manager around a one-off connection outside the pool, closed
+        afterwards. Waits while ``max_extra`` of them are open, and raises
+        ExtraConnectionError if the connection cannot be opened or logged in.
+        """
+        while not self._extra.acquire(timeout=1):
+            if is_canceled():
+                raise DownloadCanceled()
+        try:
+            try:
+                ftps = self._factory()
+            except Exception as e:
+                raise ExtraConnectionError(str(e)) from e
+            try:
+                yield ftps
+            finally:
+                ftps.close()
+        finally:
+            self._extra.release()
+
+    def close_all(self):
+        """Stop the keepalive thread and close every idle connection."""
+        self._closed.set()
+        self._keepalive_thread.join()
+        while True:
+            try:
+                ftps, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(ftps)
+
+    def _keep_alive(self):
+        """Send NOOP on connections that have been idle for too long."""
+        while not self._closed.wait(self._keepalive / 2):
+            for _ in range(self._idle.qsize()):
+                try:
+                    ftps, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if time.monotonic() - last_used < self._keepalive:
+                    self._idle.put((ftps, last_used))
+                    continue
+                try:
+                    ftps.voidcmd("NOOP")
+                except Exception:
+                    self.discard(ftps)
+                else:
+                    self._idle.put((ftps, time.monotonic()))
+
+    @staticmethod
+    def _close(ftps):
+        try:
+            ftps.quit()
+        except Exception:
+            ftps.close()
+
+class BufferedFeedbackLog:
+    """
+    Collects routine log lines and pushes them to the processing feedback in
+    batches, at most once per ``interval_ms``. Errors are reported right away,
+    after flushing what was collected before them to keep the order.
+    """
+    def __init__(self, feedback, interval_ms=500):
+        self._feedback = feedback
+        self._interval_ms = interval_ms
+        self._lines = []
+        self._timer = QElapsedTimer()
+        self._timer.start()
+
+    def info(self, line):
+        """Queue an info line, flushing if the interval has passed."""
+        self._lines.append(line)
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        """Flush if the interval has passed; call regularly so queued lines show up while idle."""
+        if self._timer.elapsed() >= self._interval_ms:
+            self.flush()
+
+    def error(self, line):
+        """Flush queued lines and report an error immediately."""
+        self.flush()
+        self._feedback.reportError(line)
+
+    def flush(self):
+        """Push all queued lines as one log entry."""
+        if self._lines:
+            self._feedback.pushInfo('\n'.join(self._lines))
+            self._lines.clear()
+        self._timer.restart()
+
 class DownloadBlockFilesFromFTPS(QgsProcessingAlgorithm):
     BLOCK_TYPE = 'BLOCK_TYPE'
     ATTRIBUTE_FIELD = 'ATTRIBUTE_FIELD'
@@ -63,18 +468,59 @@ class DownloadBlockFilesFromFTPS(QgsProcessingAlgorithm):
     FTP_PASSWORD = 'FTP_PASSWORD'
     OUTPUT_FOLDER = 'OUTPUT_FOLDER'
     UNPACK_ZIP = 'UNPACK_ZIP'
+    UNPACK_ONLY = 'UNPACK_ONLY'
+    SKIP_EXISTING = 'SKIP_EXISTING'
+    MAX_WORKERS = 'MAX_WORKERS'
+    PARALLEL_STREAMS = 'PARALLEL_STREAMS'
+    DATA_CHANNEL_PROTECTION = 'DATA_CHANNEL_PROTECTION'
 
     BLOCK_TYPES = ['DTM', 'DSM', 'Pointclouds']
+    DATA_CHANNEL_PROTECTIONS = [
+        'Private (P): encrypt transferred files',
+        'Clear (C): only login and commands are encrypted',
+    ]
+
+    FTP_SERVER = "ftp.dataforsyningen.dk"
+    FTP_PORT = 990
+    # Seconds without data before a control or data connection is given up,
+    # so a stalled transfer fails instead of blocking its worker indefinitely.
+    FTP_TIMEOUT = 60
+
+    # Field names of layers already listed in the dialog, keyed by layer ID.
+    # An entry is dropped as soon as the fields of its layer change, and the
+    # layer is forgotten when it is deleted.
+    _cached_fields = {}
+    _watched_layers = set()
 
     def tr(self, string):
         """Translate method"""
         return QCoreApplication.translate('DownloadFilesFromFTPS', string)
 
+    @classmethod
+    def _field_names(cls, layer):
+        """Return the field names of a layer, reusing the list from an earlier dialog."""
+        layer_id = layer.id()
+        fields = cls._cached_fields.get(layer_id)
+        if fields is None:
+            fields = [field.name() for field in layer.fields()]
+            cls._cached_fields[layer_id] = fields
+        if layer_id not in cls._watched_layers:
+            cls._watched_layers.add(layer_id)
+            layer.updatedFields.connect(lambda: cls._cached_fields.pop(layer_id, None))
+            layer.willBeDeleted.connect(lambda: cls._forget_layer(layer_id))
+        return fields
+
+    @classmethod
+    def _forget_layer(cls, layer_id):
+        """Drop everything cached for a layer that is being deleted."""
+        cls._cached_fields.pop(layer_id, None)
+        cls._watched_layers.discard(layer_id)
+
     def initAlgorithm(self, config=None):
         """Define parameters for the script"""
         layer = iface.activeLayer()
         if layer and layer.type() == QgsMapLayer.VectorLayer:
-            fields = [field.name() for field in layer.fields()]
+            fields = self._field_names(layer)
         else:
             fields = ['[No active layer found]']
 
@@ -134,15 +580,330 @@ class DownloadBlockFilesFromFTPS(QgsProcessingAlgorithm):
             )
         )
 
+        # Option to unpack straight from the download without keeping the zip file
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.UNPACK_ONLY,
+                self.tr('Unpack without keeping the .zip files (implies unpacking)'),
+                defaultValue=False
+            )
+        )
+
+        # Option to skip files that are already present from an earlier run
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.SKIP_EXISTING,
+                self.tr('Skip files that are already downloaded'),
+                defaultValue=True
+            )
+        )
+
+        # Number of parallel downloads, each worker uses its own FTPS connection
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_WORKERS,
+                self.tr('Number of parallel downloads'),
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=4,
+                minValue=1,
+                maxValue=16
+            )
+        )
+
+        # Number of connections used for each large file, 1 disables split downloads
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.PARALLEL_STREAMS,
+                self.tr('Parallel streams per large file (1 = off, each stream is an extra connection)'),
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=1,
+                minValue=1,
+                maxValue=8
+            )
+        )
+
+        # Data channel protection; clear data lets Linux copy files without TLS overhead
+        protection = QgsProcessingParameterEnum(
+            self.DATA_CHANNEL_PROTECTION,
+            self.tr('Data channel protection (Clear sends the files unencrypted)'),
+            options=[self.tr(option) for option in self.DATA_CHANNEL_PROTECTIONS],
+            defaultValue=0
+        )
+        protection.setFlags(protection.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(protection)
+
+    def _connect(self, username, password, protect_data=True):
+        """
+        Open and log in to a new FTPS connection. The control channel is always
+        encrypted; the data channel only when ``protect_data`` is set.
+        """
+        ftps = ImplicitFTP_TLS(timeout=self.FTP_TIMEOUT)
+        ftps.connect(self.FTP_SERVER, self.FTP_PORT)
+        ftps.login(user=username, passwd=password)
+        if protect_data:
+            ftps.prot_p()
+        else:
+            # RFC 4217 requires PBSZ before any PROT; prot_p() sends it itself
+            ftps.voidcmd('PBSZ 0')
+            ftps.prot_c()
+        # Binary mode is needed for SIZE to report the exact byte count
+        ftps.voidcmd('TYPE I')
+        return ftps
+
+    @staticmethod
+    def _remote_mtime(ftps, ftp_filepath):
+        """
+        Return the remote modification time as a UTC timestamp, or None if the
+        server cannot tell: MDTM unsupported (5xx), temporarily unavailable
+        (4xx) or an unexpected reply. The file is then compared by size only.
+        """
+        try:
+            response = ftps.voidcmd(f"MDTM {ftp_filepath}")
+            return calendar.timegm(time.strptime(response.split()[1][:14], '%Y%m%d%H%M%S'))
+        except (error_perm, error_temp, error_reply, IndexError, ValueError):
+            return None
+
+    @staticmethod
+    def _members_present(zip_ref, output_folder):
+        """Check that every file in the archive exists in the output folder with the right size."""
+        for info in zip_ref.infolist():
+            if info.is_dir():
+                continue
+            try:
+                if os.path.getsize(os.path.join(output_folder, info.filename)) != info.file_size:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    @staticmethod
+    def _member_path(output_folder, info):
+        """Return where an archive member is extracted to, refusing paths outside the output folder."""
+        root = os.path.abspath(output_folder)
+        target = os.path.abspath(os.path.join(root, info.filename))
+        if os.path.commonpath([root, target]) != root:
+            raise ValueError(f"Refusing to extract {info.filename} outside the output folder")
+        return target
+
+    def _extract_member(self, zip_ref, info, output_folder, is_canceled=lambda: False):
+        """
+        Stream one member to disk through large buffers, so memory use stays at
+        one copy buffer however big the member is.
+        """
+        target = self._member_path(output_folder, info)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            with zip_ref.open(info, 'r') as src, open(target, 'wb', buffering=WRITE_BUFFER_SIZE) as dst:
+                while True:
+                    data = src.read(TRANSFER_BLOCKSIZE)
+                    if not data:
+                        break
+                    if is_canceled():
+                        raise DownloadCanceled()
+                    dst.write(data)
+        except DownloadCanceled:
+            os.remove(target)
+            raise
+
+    def _extract_batch(self, zip_ref, infos, output_folder, archive_path=None, is_canceled=lambda: False):
+        """Extract some members, through a ZipFile of their own if ``archive_path`` is given."""
+        if archive_path is not None:
+            with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+                self._extract_batch(zip_ref, infos, output_folder, is_canceled=is_canceled)
+            return
+        for info in infos:
+            self._extract_member(zip_ref, info, output_folder, is_canceled)
+
+    def _extract_all(self, zip_ref, output_folder, executor, archive_path=None, is_canceled=lambda: False):
+        """Extract all members on the shared unzip pool, one batch of similar total size per worker."""
+        infos = zip_ref.infolist()
+        for info in infos:
+            if info.is_dir():
+                os.makedirs(self._member_path(output_folder, info), exist_ok=True)
+        files = sorted((info for info in infos if not info.is_dir()),
+                       key=lambda info: info.compress_size, reverse=True)
+        batches = [files[i::UNZIP_WORKERS] for i in range(min(UNZIP_WORKERS, len(files)))]
+        if len(batches) < 2:
+            self._extract_batch(zip_ref, files, output_folder, is_canceled=is_canceled)
+            return
+        futures = [
+            executor.submit(self._extract_batch, zip_ref, batch, output_folder, archive_path, is_canceled)
+            for batch in batches
+        ]
+        # Let every batch finish before the caller closes the archive
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    def _is_already_present(self, ftps, ftp_filepath, local_filepath, output_folder, is_zip, keep_zip):
+        """Check whether an earlier run left a copy (or unpack marker) matching the remote size and mtime."""
+        if is_zip and not keep_zip:
+            marker_filepath = local_filepath + UNPACKED_MARKER_SUFFIX
+            try:
+                with open(marker_filepath, encoding='utf-8') as f:
+                    local_size = int(f.readline())
+                    members = f.read().splitlines()
+                local_mtime = os.path.getmtime(marker_filepath)
+            except (OSError, ValueError):
+                return False
+            if not all(os.path.exists(os.path.join(output_folder, name)) for name in members):
+                return False
+        else:
+            try:
+                local_size = os.path.getsize(local_filepath)
+                local_mtime = os.path.getmtime(local_filepath)
+            except OSError:
+                return False
+
+        if ftps.size(ftp_filepath) != local_size:
+            return False
+        remote_mtime = self._remote_mtime(ftps, ftp_filepath)
+        return remote_mtime is None or remote_mtime <= local_mtime
+
+    def _supports_rest(self, ftps):
+        """Check once per run whether the server accepts REST, needed for split downloads."""
+        if self._rest_supported is None:
+            try:
+                ftps.sendcmd('REST 0')
+                self._rest_supported = True
+            except error_perm:
+                self._rest_supported = False
+        return self._rest_supported
+
+    @staticmethod
+    def _download_range(pool, ftp_filepath, part_filepath, start, end, is_canceled):
+        """Fetch bytes ``start`` to ``end`` of a remote file into the same range of the local file."""
+        # The transfer is cut off at the end of the range, so the reply on this
+        # connection is not usable; it is closed instead of being reused.
+        with pool.extra_connection(is_canceled) as ftps:
+            with open(part_filepath, 'r+b', buffering=WRITE_BUFFER_SIZE) as f:
+                f.seek(start)
+                with ftps.transfercmd(f"RETR {ftp_filepath}", rest=start) as conn:
+                    remaining = end - start
+                    while remaining:
+                        data = conn.recv(min(TRANSFER_BLOCKSIZE, remaining))
+                        if not data:
+                            raise EOFError(f"Connection closed {remaining} bytes before the end of the range")
+                        if is_canceled():
+                            raise DownloadCanceled()
+                        f.write(data)
+                        remaining -= len(data)
+
+    def _download_ranges(self, pool, ftp_filepath, local_filepath, size, streams, is_canceled):
+        """
+        Download a file in ``streams`` byte ranges over extra connections.
+        Returns False, leaving nothing behind, if one of them cannot log in.
+        """
+        part_filepath = local_filepath + '.part'
+        bounds = [size * i // streams for i in range(streams + 1)]
+        with open(part_filepath, 'wb') as f:
+            f.truncate(size)
+        # Stops the other ranges as soon as one of them fails
+        failed = threading.Event()
+
+        def range_canceled():
+            return failed.is_set() or is_canceled()
+        try:
+            with ThreadPoolExecutor(max_workers=streams) as executor:
+                futures = [
+                    executor.submit(
+                        self._download_range, pool, ftp_filepath,
+                        part_filepath, start, end, range_canceled
+                    )
+                    for start, end in zip(bounds, bounds[1:])
+                ]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    failed.set()
+                    raise
+        except ExtraConnectionError:
+            os.remove(part_filepath)
+            return False
+        except BaseException:
+            os.remove(part_filepath)
+            raise
+        os.replace(part_filepath, local_filepath)
+        return True
+
+    @staticmethod
+    def _retrieve(ftps, ftp_filepath, local_filepath, is_canceled):
+        """Download a file over a single stream, removing the partial file if canceled."""
+        try:
+            with open(local_filepath, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+                ftps.retrfile(f"RETR {ftp_filepath}", f, is_canceled=is_canceled)
+        except DownloadCanceled:
+            os.remove(local_filepath)
+            raise
+
+    def _download_one(self, pool, unzip_executor, filename, local_filepath, ftp_filepath,
+                      output_folder, unpack_zip, keep_zip=True, skip_existing=False, parallel_streams=1,
+                      is_canceled=lambda: False):
+        """
+        Download (and optionally unpack) a single block file in a worker thread.
+        Returns False if the file was skipped because it was already present.
+        """
+        if is_canceled():
+            raise DownloadCanceled()
+
+        is_zip = unpack_zip and filename.lower().endswith('.zip')
+
+        if is_zip and not keep_zip:
+            with SeekableSpooledTemporaryFile(max_size=64 << 20, dir=output_folder) as tmp:
+                with pool.connection(is_canceled) as ftps:
+                    if skip_existing and self._is_already_present(
+                            ftps, ftp_filepath, local_filepath, output_folder, is_zip, keep_zip):
+                        return False
+                    ftps.retrfile(f"RETR {ftp_filepath}", tmp, is_canceled=is_canceled)
+                size = tmp.tell()
+                tmp.seek(0)
+                with zipfile.ZipFile(tmp, 'r') as zip_ref:
+                    self._extract_all(zip_ref, output_folder, unzip_executor, is_canceled=is_canceled)
+                    members = zip_ref.namelist()
+            with open(local_filepath + UNPACKED_MARKER_SUFFIX, 'w', encoding='utf-8') as f:
+                f.write('\n'.join([str(size)] + members))
+            return True
+
+        with pool.connection(is_canceled) as ftps:
+            downloaded = not (skip_existing and self._is_already_present(
+                ftps, ftp_filepath, local_filepath, output_folder, is_zip, keep_zip))
+            size = None
+            if downloaded and parallel_streams > 1:
+                size = ftps.size(ftp_filepath)
+                if size is None or size < PARALLEL_MIN_SIZE or not self._supports_rest(ftps):
+                    size = None
+            if downloaded and size is None:
+                self._retrieve(ftps, ftp_filepath, local_filepath, is_canceled)
+
+        # Split downloads use their own connections, the pooled one is free again.
+        # If the server refuses the extra connections, use a single stream after all.
+        if size is not None and not self._download_ranges(
+                pool, ftp_filepath, local_filepath, size, parallel_streams, is_canceled):
+            with pool.connection(is_canceled) as ftps:
+                self._retrieve(ftps, ftp_filepath, local_filepath, is_canceled)
+
+        if is_zip:
+            with zipfile.ZipFile(local_filepath, 'r') as zip_ref:
+                if downloaded or not self._members_present(zip_ref, output_folder):
+                    self._extract_all(zip_ref, output_folder, unzip_executor, local_filepath, is_canceled)
+
+        # Only once unpacking is done, which reads the archive back
+        if downloaded:
+            _drop_from_page_cache(local_filepath)
+
+        return downloaded
+
     def processAlgorithm(self, parameters, context, feedback):
         """Main logic for the script"""
         layer = iface.activeLayer()
         if not layer or layer.type() != QgsMapLayer.VectorLayer:
             raise QgsProcessingException("No active vector layer found.")
 
-        fields = [field.name() for field in layer.fields()]
         attribute_index = self.parameterAsInt(parameters, self.ATTRIBUTE_FIELD, context)
-        attribute_field = fields[attribute_index]
+        if not 0 <= attribute_index < layer.fields().count():
+            raise QgsProcessingException("The selected attribute does not exist in the active layer.")
+        attribute_field = layer.fields().at(attribute_index).name()
 
         block_type_index = self.parameterAsInt(parameters, self.BLOCK_TYPE, context)
         block_type = self.BLOCK_TYPES[block_type_index]
@@ -156,13 +917,36 @@ class DownloadBlockFilesFromFTPS(QgsProcessingAlgorithm):
         if not os.path.isdir(output_folder):
             raise QgsProcessingException("Output folder does not exist or is not valid.")
 
-        unpack_zip = self.parameterAsBool(parameters, self.UNPACK_ZIP, context)
+        unpack_only = self.parameterAsBool(parameters, self.UNPACK_ONLY, context)
+        skip_existing = self.parameterAsBool(parameters, self.SKIP_EXISTING, context)
+        unpack_zip = unpack_only or self.parameterAsBool(parameters, self.UNPACK_ZIP, context)
+        max_workers = self.parameterAsInt(parameters, self.MAX_WORKERS, context)
+        parallel_streams = self.parameterAsInt(parameters, self.PARALLEL_STREAMS, context)
+        protect_data = self.parameterAsInt(parameters, self.DATA_CHANNEL_PROTECTION, context) == 0
+        self._rest_supported = None
 
-        selected_features = layer.selectedFeatures()
-        if not selected_features:
+        selected_ids = layer.selectedFeatureIds()
+        if not selected_ids:
             raise QgsProcessingException("No features are selected in the active layer.")
 
-        feedback.pushInfo(f"Processing {len(selected_features)} selected features...")
+        feedback.pushInfo(f"Processing {len(selected_ids)} selected features using grid IDs from '{attribute_field}'...")
+
+        # Only the grid ID attribute is needed, so skip geometries and other fields
+        request = (
+            QgsFeatureRequest()
+            .setFilterFids(selected_ids)
+            .setFlags(QgsFeatureRequest.NoGeometry)
+            .setSubsetOfAttributes([attribute_index])
+        )
+        log = BufferedFeedbackLog(feedback)
+        grid_ids = []
+        for feature in layer.getFeatures(request):
+            grid_id = feature[attribute_index]
+            if not grid_id:
+                log.info(f"Skipping feature ID {feature.id()} with no grid ID.")
+                continue
+            grid_ids.append(grid_id)
+        log.flush()
 
         # Set FTP path and filename format based on block type
         if block_type == 'DTM':
@@ -175,51 +959,103 @@ class DownloadBlockFilesFromFTPS(QgsProcessingAlgorithm):
             ftp_path = "/dhm_danmarks_hoejdemodel/PUNKTSKY/"
             filename_template = "PUNKTSKY_{grid_id}_TIF_UTM32-ETRS89.zip"  # Future change to LAZ
 
-        ftp_server = "ftp.dataforsyningen.dk"
-        ftp_port = 990
+        # Construct filenames based on the selected block type, along with
+        # their local and remote paths, once before any transfer starts.
+        filenames = [filename_template.format(grid_id=grid_id) for grid_id in grid_ids]
+        jobs = [
+            (filename, os.path.join(output_folder, filename), ftp_path + filename)
+            for filename in filenames
+        ]
+
+        # One directory listing tells which files can possibly be skipped, so
+        # new files do not pay for the SIZE/MDTM checks on the server.
+        existing = set(os.listdir(output_folder)) if skip_existing else set()
+        present_suffix = UNPACKED_MARKER_SUFFIX if unpack_only else ''
 
-        ftps = ImplicitFTP_TLS()
+        if not protect_data:
+            feedback.pushInfo("WARNING: Data channel protection is off, files are transferred unencrypted.")
+        # Split downloads open at most PARALLEL_STREAMS connections on top of
+        # the pooled ones, however many files are being split at once.
+        pool = FtpsPool(
+            lambda: self._connect(username, password, protect_data),
+            max_size=max_workers,
+            max_extra=parallel_streams if parallel_streams > 1 else 0
+        )
+
+        # Open the first connection up front so a bad login fails fast
+        # instead of being reported once per file by every worker.
         try:
-            ftps.connect(ftp_server, ftp_port)
-            ftps.login(user=username, passwd=password)
-            ftps.prot_p()
+            pool.release(pool.acquire())
             feedback.pushInfo("Connected to FTPS server.")
         except Exception as e:
+            pool.close_all()
             raise QgsProcessingException(f"Failed to connect to FTPS server: {str(e)}")
 
-        downloaded_files = 0
-        for feature in selected_features:
-            grid_id = feature[attribute_field]
-            if not grid_id:
-                feedback.pushInfo(f"Skipping feature ID {feature.id()} with no grid ID.")
-                continue
-
-            # Construct filename based on the selected block type
-            filename = filename_template.format(grid_id=grid_id)
+        feedback.pushInfo(f"Downloading {len(filenames)} files using {max_workers} parallel connections...")
 
-            local_filepath = os.path.join(output_folder, filename)
-            ftp_filepath = ftp_path + filename
-
-            feedback.pushInfo(f"Downloading {filename} to {local_filepath}...")
+        downloaded_files = 0
+        skipped_files = 0
+        canceled = False
+        total = len(filenames)
+        try:
+            # Archives are unpacked member by member on one pool shared by all
+            # downloads; it is entered first so it shuts down after the download workers.
+            with ThreadPoolExecutor(max_workers=UNZIP_WORKERS) as unzip_executor, \
+                    ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(
+                        self._download_one, pool, unzip_executor, filename, local_filepath,
+                        ftp_filepath, output_folder, unpack_zip, not unpack_only,
+                        filename + present_suffix in existing, parallel_streams,
+                        feedback.isCanceled
+                    ): filename
+                    for filename, local_filepath, ftp_filepath in jobs
+                }
+                done = 0
+                not_done = set(futures)
+                while not_done:
+                    # Wake up regularly, so queued lines are shown and a cancel is
+                    # noticed even while every worker is busy with a long transfer.
+                    finished, not_done = wait(not_done, timeout=0.5, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        filename = futures[future]
+                        try:
+                            downloaded = future.result()
+                        except DownloadCanceled:
+                            pass
+                        except Exception as e:
+                            log.error(f"Failed to download {filename}: {str(e)}")
+                        else:
+                            if not downloaded:
+                                skipped_files += 1
+                                log.info(f"Skipping {filename}, already present.")
+                            else:
+                                downloaded_files += 1
+                                if unpack_zip and filename.lower().endswith('.zip'):
+                                    log.info(f"Downloaded and unpacked: {filename}")
+                                else:
+                                    log.info(f"Downloaded: {filename}")
 
-            try:
-                with open(local_filepath, "wb") as f:
-                    ftps.retrbinary(f"RETR {ftp_filepath}", f.write)
-                downloaded_files += 1
-                feedback.pushInfo(f"Downloaded: {filename}")
-
-                if unpack_zip and filename.lower().endswith('.zip'):
-                    feedback.pushInfo(f"Unpacking {filename}...")
-                    with zipfile.ZipFile(local_filepath, 'r') as zip_ref:
-                        zip_ref.extractall(output_folder)
-                        feedback.pushInfo(f"Unpacked: {filename}")
-            except Exception as e:
-                feedback.reportError(f"Failed to download {filename}: {str(e)}")
+                    done += len(finished)
+                    feedback.setProgress(100 * done / total)
+                    log.flush_if_due()
+                    if feedback.isCanceled():
+                        log.flush()
+                        feedback.pushInfo("Download canceled, stopping active transfers...")
+                        canceled = True
+                        for pending in futures:
+                            pending.cancel()
+                        break
+        finally:
+            log.flush()
+            pool.close_all()
 
-        ftps.quit()
-        feedback.pushInfo(f"Download complete. {downloaded_files} files downloaded.")
+        status = "canceled" if canceled else "complete"
+        feedback.pushInfo(
+            f"Download {status}. {downloaded_files} files downloaded, {skipped_files} already present."
+        )
 
-        return {'DOWNLOADED_FILES': downloaded_files}
+        return {'DOWNLOADED_FILES': downloaded_files, 'SKIPPED_FILES': skipped_files}
 
     def name(self):
         return 'download_Block_files_from_Dataforsyning'
@@ -237,7 +1073,10 @@ class DownloadBlockFilesFromFTPS(QgsProcessingAlgorithm):
     def shortHelpString(self):
         return self.tr(
             'Downloads selected Block files (DTM, DSM, or Pointclouds) from Dataforsyningens FTPS server based on the attribute value. '
-            'Password is entered in clear text and visible in logs.'
+            'Password is entered in clear text and visible in logs. '
+            'The advanced "Clear" data channel protection sends the downloaded files unencrypted '
+            '(login and commands stay encrypted), which lets Linux write them to disk without '
+            'decrypting and copying them in Python; only use it on networks you trust.'
         )
 
     def createInstance(self):
@@ -23,7 +23,9 @@ from qgis.core import (
     QgsProcessing,
     QgsProcessingAlgorithm,
     QgsProcessingParameterString,
+    QgsProcessingParameterNumber,
     QgsProcessingException,
+    QgsApplication,
     QgsVectorLayer,
     QgsFillSymbol,
     QgsLinePatternFillSymbolLayer,
@@ -31,11 +33,42 @@ from qgis.core import (
     QgsProject
 )
 from PyQt5.QtGui import QColor
+from email.utils import formatdate
+from urllib.error import HTTPError, URLError
+import urllib.request
+import hashlib
+import os
+import time
+
+# Hatched style of the index grid, built on first use and cloned for each layer
+_HATCH_SYMBOL_PROTO = None
+
+
+def _hatch_symbol():
+    """Return a copy of the hatched fill symbol used for the index grid."""
+    global _HATCH_SYMBOL_PROTO
+    if _HATCH_SYMBOL_PROTO is None:
+        line_pattern_fill = QgsLinePatternFillSymbolLayer()
+        line_pattern_fill.setLineWidth(0.26)
+        line_pattern_fill.setDistance(2.0)
+        line_pattern_fill.setAngle(45)
+        line_pattern_fill.setColor(QColor(55, 126, 184))
+
+        outline = QgsSimpleLineSymbolLayer()
+        outline.setColor(QColor(0, 0, 0))
+        outline.setWidth(0.46)
+
+        fill_symbol = QgsFillSymbol()
+        fill_symbol.changeSymbolLayer(0, line_pattern_fill)
+        fill_symbol.appendSymbolLayer(outline)
+        _HATCH_SYMBOL_PROTO = fill_symbol
+    return _HATCH_SYMBOL_PROTO.clone()
 
 class Load10KmIndexFile(QgsProcessingAlgorithm):
     """Processing script to load a GeoJSON file with hatched style."""
 
     URL = 'URL'
+    CACHE_DAYS = 'CACHE_DAYS'
 
     def tr(self, string):
         """Translate the string."""
@@ -50,6 +83,68 @@ class Load10KmIndexFile(QgsProcessingAlgorithm):
                 defaultValue='https://raw.githubusercontent.com/Esbern/DK_10km_grid/refs/heads/main/DK_10K_grid.geojson'
             )
         )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.CACHE_DAYS,
+                self.tr('Days before the cached copy is checked for updates'),
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=30,
+                minValue=0
+            )
+        )
+
+    def _cached_copy(self, url, max_age_days, feedback):
+        """Return the path of a local copy of the GeoJSON at ``url``, revalidated after ``max_age_days``."""
+        cache_dir = os.path.join(QgsApplication.qgisSettingsDirPath(), 'dataforsyningen_downloader')
+        os.makedirs(cache_dir, exist_ok=True)
+        url_hash = hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+        cache_path = os.path.join(cache_dir, f"dk_10km_grid_{url_hash}.geojson")
+        etag_path = cache_path + '.etag'
+
+        if os.path.exists(cache_path):
+            age_days = (time.time() - os.path.getmtime(cache_path)) / 86400
+            if age_days < max_age_days:
+                feedback.pushInfo(f"Using cached copy: {cache_path}")
+                return cache_path
+
+        request = urllib.request.Request(url)
+        if os.path.exists(cache_path):
+            request.add_header('If-Modified-Since', formatdate(os.path.getmtime(cache_path), usegmt=True))
+            if os.path.exists(etag_path):
+                with open(etag_path, encoding='utf-8') as f:
+                    request.add_header('If-None-Match', f.read().strip())
+
+        part_path = cache_path + '.part'
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                try:
+                    with open(part_path, 'wb') as f:
+                        f.write(response.read())
+                except BaseException:
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                    raise
+                etag = response.headers.get('ETag')
+            os.replace(part_path, cache_path)
+            if etag:
+                with open(etag_path, 'w', encoding='utf-8') as f:
+                    f.write(etag)
+            elif os.path.exists(etag_path):
+                # The ETag of an older copy would no longer match this one
+                os.remove(etag_path)
+            feedback.pushInfo(f"Downloaded and cached: {cache_path}")
+        except HTTPError as e:
+            if e.code != 304 or not os.path.exists(cache_path):
+                raise QgsProcessingException(self.tr("Failed to download the GeoJSON file: {}").format(e))
+            # Unchanged on the server, restart the cache period
+            os.utime(cache_path)
+            feedback.pushInfo(f"Cached copy is up to date: {cache_path}")
+        except (URLError, OSError) as e:
+            if not os.path.exists(cache_path):
+                raise QgsProcessingException(self.tr("Failed to download the GeoJSON file: {}").format(e))
+            feedback.pushInfo(f"Could not reach {url} ({e}), using cached copy: {cache_path}")
+
+        return cache_path
 
     def processAlgorithm(self, parameters, context, feedback):
         """Main logic for loading the GeoJSON file."""
@@ -60,31 +155,25 @@ class Load10KmIndexFile(QgsProcessingAlgorithm):
 
         feedback.pushInfo(f"Loading GeoJSON from: {url}")
 
+        # Remote files are cached locally so repeated loads and saved projects
+        # open a local file instead of fetching the URL again.
+        if url.lower().startswith(('http://', 'https://')):
+            max_age_days = self.parameterAsInt(parameters, self.CACHE_DAYS, context)
+            source = self._cached_copy(url, max_age_days, feedback)
+        else:
+            source = url
+
         # Load the GeoJSON as a vector layer
 
-        layer = QgsVectorLayer(url, "10km_index_grid", "ogr")
+        layer = QgsVectorLayer(source, "10km_index_grid", "ogr")
 
         if not layer.isValid():
             raise QgsProcessingException(self.tr("Failed to load the GeoJSON file."))
 
         feedback.pushInfo("Applying hatched style...")
 
-        # Create a hatched style
-        line_pattern_fill = QgsLinePatternFillSymbolLayer()
-        line_pattern_fill.setLineWidth(0.26)
-        line_pattern_fill.setDistance(2.0)
-        line_pattern_fill.setAngle(45)
-        line_pattern_fill.setColor(QColor(55, 126, 184))
-
-        outline = QgsSimpleLineSymbolLayer()
-        outline.setColor(QColor(0, 0, 0))
-        outline.setWidth(0.46)
-
-        fill_symbol = QgsFillSymbol()
-        fill_symbol.changeSymbolLayer(0, line_pattern_fill)
-        fill_symbol.appendSymbolLayer(outline)
-
-        layer.renderer().setSymbol(fill_symbol)
+        # Apply the hatched style
+        layer.renderer().setSymbol(_hatch_symbol())
 
         # Add the layer to the project
         QgsProject.instance().addMapLayer(layer)
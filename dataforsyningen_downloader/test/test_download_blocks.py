@@ -0,0 +1,839 @@
+# coding=utf-8
+"""Download block files algorithm test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'holmes@ruc.dk'
+__date__ = '2025-01-29'
+__copyright__ = 'Copyright 2025, Esbern Holmes /Roskilde University'
+
+import io
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import types
+import unittest
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from ftplib import error_perm, error_reply, error_temp
+from unittest import mock
+
+from dataforsyningen_downloader.processing import download_blocks
+from dataforsyningen_downloader.processing.download_blocks import (
+    BufferedFeedbackLog,
+    DownloadBlockFilesFromFTPS,
+    DownloadCanceled,
+    FtpsPool,
+    ImplicitFTP_TLS,
+    SeekableSpooledTemporaryFile,
+    UNPACKED_MARKER_SUFFIX,
+)
+
+
+class FakeFtps(ImplicitFTP_TLS):
+    """
+    Logged-in FTPS session that serves ``files`` ({path: bytes}) without a
+    server: data connections are socket pairs fed by a background thread.
+    MDTM answers from ``mtimes`` ({path: UTC timestamp}), and ``errors``
+    ({command word: exception}) makes a command fail.
+    """
+    def __init__(self, files, mtimes=None):
+        super().__init__()
+        self.files = files
+        self.mtimes = mtimes or {}
+        self.errors = {}
+        self.commands = []
+        self.data_connections = []
+        self.closed = False
+
+    def voidcmd(self, cmd):
+        self.commands.append(cmd)
+        word, _, arg = cmd.partition(' ')
+        if word in self.errors:
+            raise self.errors[word]
+        if word == 'MDTM':
+            if arg not in self.mtimes:
+                raise error_perm('550 Could not get file modification time')
+            return '213 ' + time.strftime('%Y%m%d%H%M%S', time.gmtime(self.mtimes[arg]))
+        return '200 OK'
+
+    def sendcmd(self, cmd):
+        self.commands.append(cmd)
+        return '350 Restarting'
+
+    def size(self, path):
+        return len(self.files[path])
+
+    def transfercmd(self, cmd, rest=None):
+        self.commands.append(cmd)
+        data = self.files[cmd.split(' ', 1)[1]][rest or 0:]
+        server, client = socket.socketpair()
+
+        def send():
+            try:
+                server.sendall(data)
+            except OSError:
+                pass  # The client closed the data connection early
+            finally:
+                server.close()
+
+        threading.Thread(target=send, daemon=True).start()
+        self.data_connections.append(client)
+        return client
+
+    def voidresp(self):
+        return '226 Transfer complete'
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+def make_zip(fileobj, members):
+    """Write a deflated zip with the given {name: bytes} members to fileobj."""
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        for name, data in members.items():
+            zip_ref.writestr(name, data)
+
+
+class ExtractTest(unittest.TestCase):
+    """Test unpacking of downloaded archives."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.output_folder = tempfile.mkdtemp()
+        self.algorithm = DownloadBlockFilesFromFTPS()
+        self.members = {
+            'DTM_1km_6049_684.tif': os.urandom(50000) * 4,
+            'sub/DTM_1km_6049_685.tif': os.urandom(50000) * 4,
+            'sub/readme.txt': b'tiles',
+        }
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.output_folder)
+
+    def assert_extracted(self):
+        for name, data in self.members.items():
+            with open(os.path.join(self.output_folder, name), 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+    def test_unpack_from_spool(self):
+        """An archive spooled in memory can be unpacked in parallel."""
+        with SeekableSpooledTemporaryFile(max_size=64 << 20, dir=self.output_folder) as tmp:
+            make_zip(tmp, self.members)
+            tmp.seek(0)
+            with zipfile.ZipFile(tmp, 'r') as zip_ref, ThreadPoolExecutor(max_workers=4) as executor:
+                self.algorithm._extract_all(zip_ref, self.output_folder, executor)
+        self.assert_extracted()
+
+    def test_unpack_from_rolled_over_spool(self):
+        """An archive larger than the spool limit is unpacked from the temporary file."""
+        with SeekableSpooledTemporaryFile(max_size=1024, dir=self.output_folder) as tmp:
+            make_zip(tmp, self.members)
+            tmp.seek(0)
+            with zipfile.ZipFile(tmp, 'r') as zip_ref, ThreadPoolExecutor(max_workers=4) as executor:
+                self.algorithm._extract_all(zip_ref, self.output_folder, executor)
+        self.assert_extracted()
+
+    def test_unpack_from_path(self):
+        """A kept archive on disk is unpacked with one ZipFile per worker batch."""
+        archive_path = os.path.join(self.output_folder, 'tile.zip')
+        make_zip(archive_path, self.members)
+        with zipfile.ZipFile(archive_path, 'r') as zip_ref, ThreadPoolExecutor(max_workers=2) as executor, \
+                mock.patch.object(download_blocks, 'UNZIP_WORKERS', 2), \
+                mock.patch.object(self.algorithm, '_extract_member',
+                                  wraps=self.algorithm._extract_member) as extract_member:
+            self.algorithm._extract_all(zip_ref, self.output_folder, executor, archive_path)
+        self.assert_extracted()
+        handles = {id(call.args[0]): call.args[0] for call in extract_member.call_args_list}
+        self.assertEqual(extract_member.call_count, 3)
+        self.assertEqual(len(handles), 2)
+        self.assertNotIn(zip_ref, handles.values())
+
+    def test_failed_member_waits_for_the_others(self):
+        """A failing member is reported only after the other workers are done with the archive."""
+        extract_member = self.algorithm._extract_member
+
+        def fail_first(zip_ref, info, output_folder, is_canceled):
+            if info.filename == 'DTM_1km_6049_684.tif':
+                raise OSError('No space left on device')
+            time.sleep(0.1)
+            extract_member(zip_ref, info, output_folder, is_canceled)
+
+        self.members['DTM_1km_6049_684.tif'] *= 2
+        with SeekableSpooledTemporaryFile(max_size=64 << 20, dir=self.output_folder) as tmp:
+            make_zip(tmp, self.members)
+            tmp.seek(0)
+            with zipfile.ZipFile(tmp, 'r') as zip_ref, ThreadPoolExecutor(max_workers=3) as executor, \
+                    mock.patch.object(download_blocks, 'UNZIP_WORKERS', 3), \
+                    mock.patch.object(self.algorithm, '_extract_member', side_effect=fail_first):
+                with self.assertRaises(OSError):
+                    self.algorithm._extract_all(zip_ref, self.output_folder, executor)
+                for name in ('sub/DTM_1km_6049_685.tif', 'sub/readme.txt'):
+                    with open(os.path.join(self.output_folder, name), 'rb') as f:
+                        self.assertEqual(f.read(), self.members[name])
+
+
+class MemberPathTest(unittest.TestCase):
+    """Test that archive members cannot escape the output folder."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.output_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.output_folder)
+
+    def member_path(self, name):
+        return DownloadBlockFilesFromFTPS._member_path(self.output_folder, zipfile.ZipInfo(name))
+
+    def test_member_inside(self):
+        self.assertEqual(self.member_path('sub/tile.tif'),
+                         os.path.join(os.path.abspath(self.output_folder), 'sub', 'tile.tif'))
+
+    def test_traversal_rejected(self):
+        for name in ('../tile.tif', 'sub/../../tile.tif', '/etc/tile.tif'):
+            with self.subTest(name=name):
+                self.assertRaises(ValueError, self.member_path, name)
+
+    def test_extract_refuses_traversal(self):
+        """An archive with a member outside the output folder is not unpacked there."""
+        output_folder = os.path.join(self.output_folder, 'out')
+        os.mkdir(output_folder)
+        archive = io.BytesIO()
+        make_zip(archive, {'../evil.txt': b'evil'})
+        with zipfile.ZipFile(archive) as zip_ref:
+            self.assertRaises(ValueError, DownloadBlockFilesFromFTPS()._extract_all,
+                              zip_ref, output_folder, None)
+        self.assertEqual(os.listdir(self.output_folder), ['out'])
+
+
+class RangeDownloadTest(unittest.TestCase):
+    """Test downloads split over several connections."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.output_folder = tempfile.mkdtemp()
+        self.algorithm = DownloadBlockFilesFromFTPS()
+        self.algorithm._rest_supported = True
+        self.data = os.urandom(300001)
+        self.files = {'/DTM/tile.zip': self.data}
+        self.local_filepath = os.path.join(self.output_folder, 'tile.zip')
+        self.logins = 0
+        self.failing_logins = 0
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.output_folder)
+
+    def factory(self):
+        self.logins += 1
+        if self.logins > 1 and self.failing_logins:
+            self.failing_logins -= 1
+            raise ConnectionRefusedError('421 Too many connections')
+        return FakeFtps(self.files)
+
+    def test_ranges_are_assembled(self):
+        """All ranges land in place and the .part file is renamed at the end."""
+        pool = FtpsPool(self.factory, max_size=1, max_extra=2)
+        self.addCleanup(pool.close_all)
+        self.assertTrue(self.algorithm._download_ranges(
+            pool, '/DTM/tile.zip', self.local_filepath, len(self.data), 3, lambda: False))
+        with open(self.local_filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(os.listdir(self.output_folder), ['tile.zip'])
+
+    def test_refused_range_connection_leaves_nothing_behind(self):
+        """A range that cannot log in removes the .part file and reports the failure."""
+        self.logins = 1
+        self.failing_logins = 1
+        pool = FtpsPool(self.factory, max_size=1, max_extra=3)
+        self.addCleanup(pool.close_all)
+        self.assertFalse(self.algorithm._download_ranges(
+            pool, '/DTM/tile.zip', self.local_filepath, len(self.data), 3, lambda: False))
+        self.assertEqual(os.listdir(self.output_folder), [])
+
+    def test_falls_back_to_single_stream(self):
+        """A file is still downloaded over the pooled connection when range logins fail."""
+        self.failing_logins = 10
+        pool = FtpsPool(self.factory, max_size=1, max_extra=3)
+        self.addCleanup(pool.close_all)
+        with mock.patch.object(download_blocks, 'PARALLEL_MIN_SIZE', 0):
+            downloaded = self.algorithm._download_one(
+                pool, None, 'tile.zip', self.local_filepath, '/DTM/tile.zip',
+                self.output_folder, unpack_zip=False, parallel_streams=3)
+        self.assertTrue(downloaded)
+        with open(self.local_filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(os.listdir(self.output_folder), ['tile.zip'])
+
+
+class FtpsPoolTest(unittest.TestCase):
+    """Test the connection pool accounting."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.connections = []
+        self.failing_logins = 0
+
+    def factory(self):
+        if self.failing_logins:
+            self.failing_logins -= 1
+            raise ConnectionRefusedError('421 Too many connections')
+        ftps = FakeFtps({})
+        self.connections.append(ftps)
+        return ftps
+
+    def make_pool(self, **kwargs):
+        pool = FtpsPool(self.factory, **kwargs)
+        self.addCleanup(pool.close_all)
+        return pool
+
+    def test_released_connection_is_reused(self):
+        """A released connection is handed out again instead of logging in anew."""
+        pool = self.make_pool(max_size=2)
+        ftps = pool.acquire()
+        pool.release(ftps)
+        self.assertIs(pool.acquire(), ftps)
+        self.assertEqual(len(self.connections), 1)
+
+    def test_discard_frees_slot(self):
+        """A discarded connection is closed and makes room for a new one."""
+        pool = self.make_pool(max_size=1)
+        ftps = pool.acquire()
+        pool.discard(ftps)
+        self.assertTrue(ftps.closed)
+        self.assertIsNot(pool.acquire(), ftps)
+        self.assertEqual(len(self.connections), 2)
+
+    def test_failed_login_frees_slot(self):
+        """A connection that cannot log in does not count against the pool size."""
+        pool = self.make_pool(max_size=1)
+        self.failing_logins = 1
+        self.assertRaises(ConnectionRefusedError, pool.acquire)
+        self.assertIs(pool.acquire(), self.connections[0])
+
+    def test_acquire_waits_for_release(self):
+        """A full pool hands out the next released connection."""
+        pool = self.make_pool(max_size=1)
+        ftps = pool.acquire()
+        threading.Timer(0.1, pool.release, (ftps,)).start()
+        self.assertIs(pool.acquire(), ftps)
+        self.assertEqual(len(self.connections), 1)
+
+    def test_connection_keeps_session_on_permanent_error(self):
+        """A 5xx reply leaves the session usable, any other failure discards it."""
+        pool = self.make_pool(max_size=1)
+        with self.assertRaises(error_perm):
+            with pool.connection():
+                raise error_perm('550 No such file')
+        with self.assertRaises(OSError):
+            with pool.connection() as ftps:
+                self.assertIs(ftps, self.connections[0])
+                raise OSError('Connection reset')
+        self.assertTrue(self.connections[0].closed)
+        with pool.connection() as ftps:
+            self.assertIs(ftps, self.connections[1])
+
+    def test_keepalive_requeues_idle_connection(self):
+        """Idle connections get a NOOP and go back to the pool."""
+        pool = self.make_pool(max_size=1, keepalive=0.1)
+        ftps = pool.acquire()
+        pool.release(ftps)
+        time.sleep(0.3)
+        self.assertIn('NOOP', ftps.commands)
+        self.assertIs(pool.acquire(), ftps)
+
+    def test_keepalive_discards_dead_connection(self):
+        """A connection that fails the NOOP is dropped and its slot reused."""
+        pool = self.make_pool(max_size=1, keepalive=0.1)
+        ftps = pool.acquire()
+        ftps.errors['NOOP'] = EOFError()
+        pool.release(ftps)
+        time.sleep(0.3)
+        self.assertTrue(ftps.closed)
+        self.assertIs(pool.acquire(), self.connections[1])
+
+    def test_extra_connections_are_capped(self):
+        """No more than max_extra extra connections are ever open at once."""
+        pool = self.make_pool(max_size=1, max_extra=2)
+        lock = threading.Lock()
+        open_now = []
+        peak = []
+
+        def use_extra():
+            with pool.extra_connection() as ftps:
+                with lock:
+                    open_now.append(ftps)
+                    peak.append(len(open_now))
+                time.sleep(0.05)
+                with lock:
+                    open_now.remove(ftps)
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            for future in [executor.submit(use_extra) for _ in range(5)]:
+                future.result()
+        self.assertEqual(max(peak), 2)
+        self.assertTrue(all(ftps.closed for ftps in self.connections))
+
+
+class ReceiveBufferTest(unittest.TestCase):
+    """Test when data connections get a fixed receive buffer."""
+
+    def buffer_size(self, platform, rmem_max=None, tcp_rmem=None):
+        proc = {
+            '/proc/sys/net/core/rmem_max': rmem_max,
+            '/proc/sys/net/ipv4/tcp_rmem': tcp_rmem,
+        }
+
+        def fake_open(path, *args, **kwargs):
+            if proc.get(path) is None:
+                raise FileNotFoundError(path)
+            return io.StringIO(proc[path])
+
+        with mock.patch.object(download_blocks.sys, 'platform', platform), \
+                mock.patch('builtins.open', fake_open):
+            return download_blocks._data_receive_buffer_size()
+
+    def test_other_platforms_use_fixed_buffer(self):
+        self.assertEqual(self.buffer_size('win32'), download_blocks.RECEIVE_BUFFER_SIZE)
+
+    def test_linux_keeps_autotuning_by_default(self):
+        """With default sysctls autotuning grows further than a capped fixed buffer."""
+        self.assertIsNone(self.buffer_size('linux', '212992\n', '4096\t131072\t6291456\n'))
+
+    def test_linux_uses_fixed_buffer_above_autotuning(self):
+        self.assertEqual(self.buffer_size('linux', '16777216\n', '4096\t131072\t4194304\n'),
+                         download_blocks.RECEIVE_BUFFER_SIZE)
+
+    def test_linux_without_proc(self):
+        self.assertIsNone(self.buffer_size('linux'))
+
+
+class AlreadyPresentTest(unittest.TestCase):
+    """Test detection of files left complete by an earlier run."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.output_folder = tempfile.mkdtemp()
+        self.algorithm = DownloadBlockFilesFromFTPS()
+        self.data = b'tile data'
+        self.ftps = FakeFtps({'/DTM/tile.zip': self.data}, {'/DTM/tile.zip': 1700000000})
+        self.local_filepath = os.path.join(self.output_folder, 'tile.zip')
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.output_folder)
+
+    def write_local(self, data, mtime=1700000000):
+        with open(self.local_filepath, 'wb') as f:
+            f.write(data)
+        os.utime(self.local_filepath, (mtime, mtime))
+
+    def is_present(self, keep_zip=True):
+        return self.algorithm._is_already_present(
+            self.ftps, '/DTM/tile.zip', self.local_filepath, self.output_folder, True, keep_zip)
+
+    def test_missing_file(self):
+        self.assertFalse(self.is_present())
+
+    def test_same_size_and_not_older(self):
+        self.write_local(self.data)
+        self.assertTrue(self.is_present())
+
+    def test_size_differs(self):
+        self.write_local(self.data[:-1])
+        self.assertFalse(self.is_present())
+
+    def test_remote_is_newer(self):
+        self.write_local(self.data, mtime=1600000000)
+        self.assertFalse(self.is_present())
+
+    def test_mdtm_unavailable_falls_back_to_size(self):
+        """Permanent, temporary and unexpected MDTM replies all mean unknown mtime."""
+        self.write_local(self.data, mtime=1600000000)
+        for error in (error_perm('502 Command not implemented'),
+                      error_temp('450 File unavailable'),
+                      error_reply('150 Unexpected')):
+            self.ftps.errors['MDTM'] = error
+            self.assertTrue(self.is_present())
+
+    def write_marker(self, size, members):
+        with open(self.local_filepath + UNPACKED_MARKER_SUFFIX, 'w', encoding='utf-8') as f:
+            f.write('\n'.join([str(size)] + members))
+
+    def test_marker_with_members(self):
+        """Without a kept zip the marker stands in for it, as long as its members exist."""
+        self.write_marker(len(self.data), ['DTM_1km_6049_684.tif'])
+        open(os.path.join(self.output_folder, 'DTM_1km_6049_684.tif'), 'wb').close()
+        self.assertTrue(self.is_present(keep_zip=False))
+
+    def test_marker_with_missing_member(self):
+        self.write_marker(len(self.data), ['DTM_1km_6049_684.tif'])
+        self.assertFalse(self.is_present(keep_zip=False))
+
+    def test_marker_size_differs(self):
+        self.write_marker(len(self.data) + 1, [])
+        self.assertFalse(self.is_present(keep_zip=False))
+
+    def test_unreadable_marker(self):
+        with open(self.local_filepath + UNPACKED_MARKER_SUFFIX, 'w', encoding='utf-8') as f:
+            f.write('not a size')
+        self.assertFalse(self.is_present(keep_zip=False))
+
+
+class IsalUnzipTest(unittest.TestCase):
+    """Test that zipfile inflates members with isal when it is installed."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.isal_zlib = types.SimpleNamespace(
+            decompressobj=mock.Mock(wraps=zlib.decompressobj), crc32=zlib.crc32)
+        # Undo the patch after each test
+        patcher = mock.patch.object(zipfile, '_get_decompressor', zipfile._get_decompressor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_member(self):
+        archive = io.BytesIO()
+        make_zip(archive, {'tile.tif': b'tile data' * 1000})
+        with zipfile.ZipFile(archive) as zip_ref:
+            return zip_ref.read('tile.tif')
+
+    def test_deflate_members_use_isal(self):
+        with mock.patch.object(download_blocks, 'isal_zlib', self.isal_zlib):
+            download_blocks._use_isal_for_unzip()
+            download_blocks._use_isal_for_unzip()
+            self.assertEqual(self.read_member(), b'tile data' * 1000)
+        self.isal_zlib.decompressobj.assert_called_once_with(-15)
+
+    def test_other_methods_keep_stdlib(self):
+        with mock.patch.object(download_blocks, 'isal_zlib', self.isal_zlib):
+            download_blocks._use_isal_for_unzip()
+        self.assertIsNone(zipfile._get_decompressor(zipfile.ZIP_STORED))
+
+    def test_without_isal(self):
+        stdlib_get_decompressor = zipfile._get_decompressor
+        with mock.patch.object(download_blocks, 'isal_zlib', None):
+            download_blocks._use_isal_for_unzip()
+        self.assertIs(zipfile._get_decompressor, stdlib_get_decompressor)
+
+
+class FastCrc32Test(unittest.TestCase):
+    """Test that zipfile checks CRCs with libdeflate or isal when installed."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.deflate = types.SimpleNamespace(crc32=mock.Mock(wraps=zlib.crc32))
+        self.isal_zlib = types.SimpleNamespace(crc32=mock.Mock(wraps=zlib.crc32))
+        patcher = mock.patch.object(zipfile, 'crc32', zipfile.crc32)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def use_fast_crc32(self, deflate, isal_zlib):
+        with mock.patch.object(download_blocks, 'deflate', deflate), \
+                mock.patch.object(download_blocks, 'isal_zlib', isal_zlib):
+            download_blocks._use_fast_crc32_for_unzip()
+
+    def test_libdeflate_is_preferred(self):
+        self.use_fast_crc32(self.deflate, self.isal_zlib)
+        self.assertIs(zipfile.crc32, self.deflate.crc32)
+        archive = io.BytesIO()
+        make_zip(archive, {'tile.tif': b'tile data'})
+        with zipfile.ZipFile(archive) as zip_ref:
+            self.assertEqual(zip_ref.read('tile.tif'), b'tile data')
+        self.assertTrue(self.deflate.crc32.called)
+
+    def test_isal_fallback(self):
+        self.use_fast_crc32(None, self.isal_zlib)
+        self.assertIs(zipfile.crc32, self.isal_zlib.crc32)
+
+    def test_without_either(self):
+        self.use_fast_crc32(None, None)
+        self.assertIs(zipfile.crc32, zlib.crc32)
+
+
+class TransferTypeTest(unittest.TestCase):
+    """Test that TYPE I is only sent when the session is not in binary mode already."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.ftps = ImplicitFTP_TLS()
+        self.sent = []
+        # Record what reaches the control connection and answer every command
+        self.ftps.putcmd = self.sent.append
+        self.ftps.getresp = lambda: '200 OK'
+
+    def test_type_i_sent_once(self):
+        self.ftps.voidcmd('TYPE I')
+        self.ftps.voidcmd('TYPE I')
+        self.assertEqual(self.sent, ['TYPE I'])
+
+    def test_other_type_resets_binary_mode(self):
+        self.ftps.voidcmd('TYPE I')
+        self.ftps.voidcmd('TYPE A')
+        self.ftps.voidcmd('TYPE I')
+        self.assertEqual(self.sent, ['TYPE I', 'TYPE A', 'TYPE I'])
+
+    def test_type_through_sendcmd_resets_binary_mode(self):
+        """retrlines() switches to ASCII with sendcmd, which must not go unnoticed."""
+        self.ftps.voidcmd('TYPE I')
+        self.ftps.sendcmd('TYPE A')
+        self.ftps.voidcmd('TYPE I')
+        self.assertEqual(self.sent, ['TYPE I', 'TYPE A', 'TYPE I'])
+
+    def test_other_commands_pass_through(self):
+        self.ftps.voidcmd('TYPE I')
+        self.ftps.voidcmd('NOOP')
+        self.ftps.voidcmd('TYPE I')
+        self.assertEqual(self.sent, ['TYPE I', 'NOOP'])
+
+
+class FakeSignal:
+    """Minimal stand-in for a Qt signal."""
+
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+    def emit(self):
+        for slot in list(self.slots):
+            slot()
+
+
+class FakeLayer:
+    """Vector layer stand-in with the ID, fields and signals _field_names uses."""
+
+    def __init__(self, layer_id, names):
+        self._id = layer_id
+        self.names = names
+        self.updatedFields = FakeSignal()
+        self.willBeDeleted = FakeSignal()
+
+    def id(self):
+        return self._id
+
+    def fields(self):
+        return [types.SimpleNamespace(name=lambda name=name: name) for name in self.names]
+
+
+class FieldNamesTest(unittest.TestCase):
+    """Test the per-layer cache of field names shown in the dialog."""
+
+    def setUp(self):
+        """Runs before each test."""
+        for name, value in (('_cached_fields', {}), ('_watched_layers', set())):
+            patcher = mock.patch.object(DownloadBlockFilesFromFTPS, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.layer = FakeLayer('tiles_1', ['kn10kmdk', 'note'])
+
+    def field_names(self):
+        return DownloadBlockFilesFromFTPS._field_names(self.layer)
+
+    def test_fields_are_cached(self):
+        self.assertEqual(self.field_names(), ['kn10kmdk', 'note'])
+        self.layer.names = ['changed']
+        self.assertEqual(self.field_names(), ['kn10kmdk', 'note'])
+
+    def test_changed_fields_are_listed_again(self):
+        """Every cache miss reuses the slots connected on the first one."""
+        self.field_names()
+        for names in (['kn10kmdk'], ['kn10kmdk', 'id']):
+            self.layer.names = names
+            self.layer.updatedFields.emit()
+            self.assertEqual(self.field_names(), names)
+        self.assertEqual(len(self.layer.updatedFields.slots), 1)
+        self.assertEqual(len(self.layer.willBeDeleted.slots), 1)
+
+    def test_deleted_layer_is_forgotten(self):
+        self.field_names()
+        self.layer.willBeDeleted.emit()
+        self.assertEqual(DownloadBlockFilesFromFTPS._cached_fields, {})
+        self.assertEqual(DownloadBlockFilesFromFTPS._watched_layers, set())
+
+
+class FakeTimer:
+    """QElapsedTimer stand-in whose elapsed time is set by the test."""
+
+    def __init__(self):
+        self.ms = 0
+
+    def elapsed(self):
+        return self.ms
+
+    def restart(self):
+        self.ms = 0
+
+
+class BufferedFeedbackLogTest(unittest.TestCase):
+    """Test batching of routine log lines."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.feedback = mock.Mock()
+        self.log = BufferedFeedbackLog(self.feedback, interval_ms=500)
+        self.timer = self.log._timer = FakeTimer()
+
+    def test_lines_are_batched(self):
+        self.log.info('Downloaded: a.zip')
+        self.log.info('Downloaded: b.zip')
+        self.feedback.pushInfo.assert_not_called()
+        self.timer.ms = 500
+        self.log.info('Downloaded: c.zip')
+        self.feedback.pushInfo.assert_called_once_with(
+            'Downloaded: a.zip\nDownloaded: b.zip\nDownloaded: c.zip')
+
+    def test_flush_if_due_without_new_lines(self):
+        """Queued lines show up once the interval has passed, even if no line follows."""
+        self.log.info('Downloaded: a.zip')
+        self.log.flush_if_due()
+        self.feedback.pushInfo.assert_not_called()
+        self.timer.ms = 600
+        self.log.flush_if_due()
+        self.feedback.pushInfo.assert_called_once_with('Downloaded: a.zip')
+
+    def test_error_keeps_order(self):
+        manager = mock.Mock()
+        manager.attach_mock(self.feedback, 'feedback')
+        self.log.info('Downloaded: a.zip')
+        self.log.error('Failed to download b.zip')
+        self.assertEqual(manager.mock_calls, [
+            mock.call.feedback.pushInfo('Downloaded: a.zip'),
+            mock.call.feedback.reportError('Failed to download b.zip'),
+        ])
+
+    def test_empty_flush_pushes_nothing(self):
+        self.log.flush()
+        self.feedback.pushInfo.assert_not_called()
+
+
+def cancel_after(checks):
+    """Return an is_canceled callback that turns True after ``checks`` calls."""
+    calls = iter(range(checks))
+    return lambda: next(calls, None) is None
+
+
+class CancelTest(unittest.TestCase):
+    """Test that canceled transfers stop and leave no partial files behind."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.output_folder = tempfile.mkdtemp()
+        self.algorithm = DownloadBlockFilesFromFTPS()
+        self.algorithm._rest_supported = True
+        self.data = os.urandom(3 << 20)
+        self.files = {'/DTM/tile.zip': self.data}
+        self.ftps = FakeFtps(self.files)
+        self.local_filepath = os.path.join(self.output_folder, 'tile.zip')
+        self.pool = FtpsPool(lambda: self.ftps, max_size=1, max_extra=2)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.pool.close_all()
+        shutil.rmtree(self.output_folder)
+
+    def test_retrfile_closes_data_connection(self):
+        """Both the copy loop and the splice path stop on cancel with the data connection closed."""
+        with open(self.local_filepath, 'wb') as f:
+            self.assertRaises(DownloadCanceled, self.ftps.retrfile,
+                              'RETR /DTM/tile.zip', f, is_canceled=cancel_after(1))
+        self.assertRaises(DownloadCanceled, self.ftps.retrfile,
+                          'RETR /DTM/tile.zip', io.BytesIO(), is_canceled=cancel_after(1))
+        for conn in self.ftps.data_connections:
+            self.assertEqual(conn.fileno(), -1)
+
+    def test_single_stream_removes_partial_file(self):
+        with self.assertRaises(DownloadCanceled):
+            self.algorithm._download_one(
+                self.pool, None, 'tile.zip', self.local_filepath, '/DTM/tile.zip',
+                self.output_folder, unpack_zip=False, is_canceled=cancel_after(2))
+        self.assertEqual(os.listdir(self.output_folder), [])
+        # The session is out of step with the server, so it is not reused
+        self.assertTrue(self.ftps.closed)
+
+    def test_spooled_unpack_leaves_nothing_behind(self):
+        with self.assertRaises(DownloadCanceled):
+            self.algorithm._download_one(
+                self.pool, None, 'tile.zip', self.local_filepath, '/DTM/tile.zip',
+                self.output_folder, unpack_zip=True, keep_zip=False, is_canceled=cancel_after(2))
+        self.assertEqual(os.listdir(self.output_folder), [])
+
+    def test_ranges_remove_part_file(self):
+        with self.assertRaises(DownloadCanceled):
+            self.algorithm._download_ranges(
+                self.pool, '/DTM/tile.zip', self.local_filepath, len(self.data), 2, cancel_after(1))
+        self.assertEqual(os.listdir(self.output_folder), [])
+
+    def test_canceled_before_start(self):
+        with self.assertRaises(DownloadCanceled):
+            self.algorithm._download_one(
+                self.pool, None, 'tile.zip', self.local_filepath, '/DTM/tile.zip',
+                self.output_folder, unpack_zip=False, is_canceled=lambda: True)
+        self.assertEqual(self.ftps.commands, [])
+
+    def test_extraction_stops_and_removes_partial_member(self):
+        """A canceled unpack stops mid-member instead of finishing the archive."""
+        archive = io.BytesIO()
+        make_zip(archive, {'a.tif': os.urandom(3 << 20), 'b.tif': os.urandom(3 << 20)})
+        canceled = threading.Event()
+        reads = []
+
+        def is_canceled():
+            reads.append(None)
+            if len(reads) > 2:
+                canceled.set()
+            return canceled.is_set()
+
+        with zipfile.ZipFile(archive) as zip_ref, ThreadPoolExecutor(max_workers=2) as executor, \
+                mock.patch.object(download_blocks, 'UNZIP_WORKERS', 2):
+            self.assertRaises(DownloadCanceled, self.algorithm._extract_all,
+                              zip_ref, self.output_folder, executor, is_canceled=is_canceled)
+        self.assertEqual(os.listdir(self.output_folder), [])
+
+    def test_waiting_for_pooled_connection_stops(self):
+        """A worker waiting on a full pool gives up once the run is canceled."""
+        self.pool.acquire()
+        started = time.monotonic()
+        self.assertRaises(DownloadCanceled, self.pool.acquire, lambda: True)
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_waiting_for_extra_connection_stops(self):
+        with self.pool.extra_connection(), self.pool.extra_connection():
+            with self.assertRaises(DownloadCanceled):
+                with self.pool.extra_connection(lambda: True):
+                    self.fail('No third extra connection may be opened')
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite([
+        unittest.makeSuite(ExtractTest),
+        unittest.makeSuite(MemberPathTest),
+        unittest.makeSuite(RangeDownloadTest),
+        unittest.makeSuite(CancelTest),
+        unittest.makeSuite(FtpsPoolTest),
+        unittest.makeSuite(FieldNamesTest),
+        unittest.makeSuite(BufferedFeedbackLogTest),
+        unittest.makeSuite(TransferTypeTest),
+        unittest.makeSuite(ReceiveBufferTest),
+        unittest.makeSuite(AlreadyPresentTest),
+        unittest.makeSuite(IsalUnzipTest),
+        unittest.makeSuite(FastCrc32Test),
+    ])
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
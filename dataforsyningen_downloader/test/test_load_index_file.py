@@ -0,0 +1,149 @@
+# coding=utf-8
+"""Load index file algorithm test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'holmes@ruc.dk'
+__date__ = '2025-01-29'
+__copyright__ = 'Copyright 2025, Esbern Holmes /Roskilde University'
+
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+from unittest import mock
+from urllib.error import HTTPError, URLError
+
+from dataforsyningen_downloader.processing import load_index_file
+from dataforsyningen_downloader.processing.load_index_file import Load10KmIndexFile
+
+URL = 'https://example.com/DK_10K_grid.geojson'
+
+
+class FakeResponse:
+    """urlopen() result with a body and response headers."""
+
+    def __init__(self, body, headers=None):
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def read(self):
+        if isinstance(self.body, Exception):
+            raise self.body
+        return self.body
+
+
+class CachedCopyTest(unittest.TestCase):
+    """Test the local cache of the index GeoJSON."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.settings_dir = tempfile.mkdtemp()
+        patcher = mock.patch.object(load_index_file, 'QgsApplication')
+        patcher.start().qgisSettingsDirPath.return_value = self.settings_dir
+        self.addCleanup(patcher.stop)
+        self.algorithm = Load10KmIndexFile()
+        self.feedback = mock.Mock()
+        self.requests = []
+        self.replies = []
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.settings_dir)
+
+    def urlopen(self, request, timeout=None):
+        self.requests.append(request)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def cached_copy(self, max_age_days=30):
+        with mock.patch('urllib.request.urlopen', self.urlopen):
+            return self.algorithm._cached_copy(URL, max_age_days, self.feedback)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def expire(self, path):
+        old = time.time() - 40 * 86400
+        os.utime(path, (old, old))
+
+    def cache_files(self):
+        return sorted(os.listdir(os.path.join(self.settings_dir, 'dataforsyningen_downloader')))
+
+    def test_first_download_is_cached_with_etag(self):
+        self.replies.append(FakeResponse(b'{"grid": 1}', {'ETag': '"v1"'}))
+        path = self.cached_copy()
+        self.assertEqual(self.read(path), b'{"grid": 1}')
+        self.assertEqual(self.read(path + '.etag'), b'"v1"')
+
+    def test_fresh_copy_is_used_without_request(self):
+        self.replies.append(FakeResponse(b'{"grid": 1}'))
+        path = self.cached_copy()
+        self.assertEqual(self.cached_copy(), path)
+        self.assertEqual(len(self.requests), 1)
+
+    def test_expired_copy_is_revalidated(self):
+        """An unchanged file on the server answers 304 and restarts the cache period."""
+        self.replies.append(FakeResponse(b'{"grid": 1}', {'ETag': '"v1"'}))
+        path = self.cached_copy()
+        self.expire(path)
+        self.replies.append(HTTPError(URL, 304, 'Not Modified', {}, None))
+        self.assertEqual(self.cached_copy(), path)
+        request = self.requests[-1]
+        self.assertEqual(request.get_header('If-none-match'), '"v1"')
+        self.assertIsNotNone(request.get_header('If-modified-since'))
+        self.assertEqual(self.read(path), b'{"grid": 1}')
+        self.assertLess(time.time() - os.path.getmtime(path), 60)
+
+    def test_reply_without_etag_drops_old_etag(self):
+        self.replies.append(FakeResponse(b'{"grid": 1}', {'ETag': '"v1"'}))
+        path = self.cached_copy()
+        self.expire(path)
+        self.replies.append(FakeResponse(b'{"grid": 2}'))
+        self.cached_copy()
+        self.assertEqual(self.read(path), b'{"grid": 2}')
+        self.assertFalse(os.path.exists(path + '.etag'))
+
+    def test_offline_uses_cached_copy(self):
+        self.replies.append(FakeResponse(b'{"grid": 1}'))
+        path = self.cached_copy()
+        self.expire(path)
+        self.replies.append(URLError('Name or service not known'))
+        self.assertEqual(self.cached_copy(), path)
+        self.assertEqual(self.read(path), b'{"grid": 1}')
+
+    def test_offline_without_cached_copy(self):
+        self.replies.append(URLError('Name or service not known'))
+        self.assertRaises(load_index_file.QgsProcessingException, self.cached_copy)
+
+    def test_interrupted_download_leaves_no_part_file(self):
+        """A transfer failing half way keeps the old copy and cleans up the partial one."""
+        self.replies.append(FakeResponse(b'{"grid": 1}'))
+        path = self.cached_copy()
+        self.expire(path)
+        self.replies.append(FakeResponse(socket.timeout('timed out')))
+        self.assertEqual(self.cached_copy(), path)
+        self.assertEqual(self.read(path), b'{"grid": 1}')
+        self.assertEqual(self.cache_files(), [os.path.basename(path)])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(CachedCopyTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)